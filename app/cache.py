@@ -0,0 +1,106 @@
+import uuid
+from dataclasses import dataclass, fields, replace
+from datetime import datetime
+
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import select
+
+from .models import Asset, AssetVersion, http_date
+from .storage import presigned_get_url
+
+
+# ----------------------------------
+# Cached metadata (detached from the ORM session)
+# ----------------------------------
+@dataclass(frozen=True)
+class AssetMeta:
+    id: uuid.UUID
+    object_storage_key: str
+    filename: str
+    mime_type: str
+    size_bytes: int
+    etag: str
+    created_at: datetime
+    last_modified_http: str
+
+
+@dataclass(frozen=True)
+class VersionMeta:
+    id: uuid.UUID
+    asset_id: uuid.UUID
+    object_storage_key: str
+    etag: str
+    br_object_storage_key: str | None
+    created_at: datetime
+    last_modified_http: str
+
+
+# Cache misses select just these columns; skipping ORM instances avoids
+# instrumentation and identity-map overhead on the hot path
+_ASSET_COLUMNS = [getattr(Asset, f.name) for f in fields(AssetMeta)]
+_VERSION_COLUMNS = [getattr(AssetVersion, f.name) for f in fields(VersionMeta)]
+
+
+# AssetVersion rows are immutable, so they never need invalidation.
+# Asset rows get a short TTL in case they are ever mutated.
+version_cache = LRUCache(maxsize=10_000)
+asset_cache = TTLCache(maxsize=10_000, ttl=30)
+# Presigned URLs for immutable versions. Entries expire well before the
+# 7 day URL lifetime, so a URL handed out (and cached by clients for up to
+# a day) is always still valid.
+url_cache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+
+
+def _with_last_modified(meta):
+    # Rows written before last_modified_http existed hold NULL
+    if meta.last_modified_http is None:
+        return replace(meta, last_modified_http=http_date(meta.created_at))
+    return meta
+
+
+async def get_asset(db, asset_id):
+    meta = asset_cache.get(asset_id)
+    if meta is not None:
+        return meta
+
+    row = (
+        await db.execute(select(*_ASSET_COLUMNS).where(Asset.id == asset_id))
+    ).first()
+    if not row:
+        return None
+
+    meta = _with_last_modified(AssetMeta(*row))
+    asset_cache[asset_id] = meta
+    return meta
+
+
+async def get_version(db, version_id):
+    meta = version_cache.get(version_id)
+    if meta is not None:
+        return meta
+
+    row = (
+        await db.execute(
+            select(*_VERSION_COLUMNS).where(AssetVersion.id == version_id)
+        )
+    ).first()
+    if not row:
+        return None
+
+    meta = _with_last_modified(VersionMeta(*row))
+    version_cache[version_id] = meta
+    return meta
+
+
+async def get_version_url(s3, version, brotli=False):
+    key = (version.id, brotli)
+    url = url_cache.get(key)
+    if url is None:
+        object_key = (
+            version.br_object_storage_key
+            if brotli
+            else version.object_storage_key
+        )
+        url = await presigned_get_url(s3, object_key)
+        url_cache[key] = url
+    return url
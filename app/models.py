@@ -1,4 +1,7 @@
 import uuid
+from datetime import timezone
+from email.utils import format_datetime
+
 from sqlalchemy import (
     Column,
     String,
@@ -13,11 +16,18 @@ from sqlalchemy.orm import relationship
 from .database import Base
 
 
+def http_date(value):
+    # RFC 1123 date for Last-Modified; format_datetime wants exactly UTC
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
 # ----------------------------------
 # Asset (Mutable Content)
 # ----------------------------------
 class Asset(Base):
     __tablename__ = "assets"
+    # Fetch server defaults via INSERT ... RETURNING, not a follow-up SELECT
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     object_storage_key = Column(String, unique=True, nullable=False)
@@ -27,10 +37,15 @@ class Asset(Base):
     etag = Column(String, nullable=False)
     is_private = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Pre-formatted RFC 1123 date for the Last-Modified header
+    last_modified_http = Column(String)
 
     # Relationship
-    versions = relationship("AssetVersion", back_populates="asset")
-    tokens = relationship("AccessToken", back_populates="asset")
+    # lazy="raise" turns accidental lazy loads (N+1) into errors
+    versions = relationship(
+        "AssetVersion", back_populates="asset", lazy="raise"
+    )
+    tokens = relationship("AccessToken", back_populates="asset", lazy="raise")
 
 
 # ----------------------------------
@@ -38,12 +53,17 @@ class Asset(Base):
 # ----------------------------------
 class AssetVersion(Base):
     __tablename__ = "asset_versions"
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id"), nullable=False)
     object_storage_key = Column(String, unique=True, nullable=False)
     etag = Column(String, nullable=False)
+    # Brotli-encoded copy for text types, if one was stored at publish time
+    br_object_storage_key = Column(String)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    # Pre-formatted RFC 1123 date for the Last-Modified header
+    last_modified_http = Column(String)
 
     # Relationship
     asset = relationship("Asset", back_populates="versions")
@@ -54,10 +74,13 @@ class AssetVersion(Base):
 # ----------------------------------
 class AccessToken(Base):
     __tablename__ = "access_tokens"
+    __mapper_args__ = {"eager_defaults": True}
 
     token = Column(String, primary_key=True)
     asset_id = Column(UUID(as_uuid=True), ForeignKey("assets.id"), nullable=False)
     expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
+    # expires_at as Unix seconds, for a cheap integer expiry check
+    expires_at_epoch = Column(BigInteger, index=True)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
     # Relationship
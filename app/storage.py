@@ -1,10 +1,239 @@
-import boto3
+import asyncio
+import hashlib
 
-s3 = boto3.client(
-    "s3",
-    endpoint_url="http://localhost:9000",
-    aws_access_key_id="minio",
-    aws_secret_access_key="minio123",
-)
+import aioboto3
+import brotli
+import anyio.to_thread
+from aiobotocore.config import AioConfig
+from botocore.exceptions import BotoCoreError, ClientError
+
+S3_ENDPOINT = "http://localhost:9000"
+S3_ACCESS_KEY = "minio"
+S3_SECRET_KEY = "minio123"
+S3_REGION = "us-east-1"
 
 BUCKET_NAME = "assets"
+
+# Multipart upload tuning (S3 requires parts >= 5 MiB except the last)
+PART_SIZE = 8 * 1024 * 1024
+MAX_INFLIGHT_PARTS = 8
+
+# Read size when streaming object bodies back to clients
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# SigV4 presigned URLs are valid for at most 7 days
+PRESIGNED_URL_TTL = 7 * 24 * 3600
+
+# Text-like types get a Brotli-encoded copy at publish time. Quality 11
+# runs at roughly 0.4 MiB/s and happens inside the publish request, so the
+# cap keeps that to a few seconds per publish.
+COMPRESSIBLE_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/wasm",
+}
+BROTLI_MAX_BYTES = 1024 * 1024
+
+# Large pool of HTTP keep-alive connections (idle for up to 60 s) so bursts
+# of parallel requests reuse connections instead of opening new ones.
+# Path-style addressing is what MinIO on localhost understands; switch to
+# "virtual" against AWS S3.
+S3_CONFIG = AioConfig(
+    max_pool_connections=128,
+    retries={"mode": "adaptive", "max_attempts": 3},
+    signature_version="s3v4",
+    s3={"addressing_style": "path"},
+    connector_args={"keepalive_timeout": 60},
+)
+
+session = aioboto3.Session()
+
+
+def create_s3_client():
+    # Async context manager; opened once for the app lifetime in main.lifespan
+    return session.client(
+        "s3",
+        endpoint_url=S3_ENDPOINT,
+        aws_access_key_id=S3_ACCESS_KEY,
+        aws_secret_access_key=S3_SECRET_KEY,
+        region_name=S3_REGION,
+        config=S3_CONFIG,
+    )
+
+
+async def warm_up(s3):
+    # Open a pooled connection at startup so the first request doesn't pay
+    # for the handshake. Best effort: a missing bucket or an unreachable
+    # endpoint must not stop the app from starting.
+    try:
+        await s3.head_bucket(Bucket=BUCKET_NAME)
+    except (BotoCoreError, ClientError):
+        pass
+
+
+async def iter_object(body, chunk_size=STREAM_CHUNK_SIZE):
+    # Stream an S3 object body without buffering it in memory
+    async with body:
+        async for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+
+
+async def presigned_get_url(s3, key):
+    return await s3.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": BUCKET_NAME, "Key": key},
+        ExpiresIn=PRESIGNED_URL_TTL,
+    )
+
+
+def is_compressible(mime_type):
+    mime_type = (mime_type or "").split(";")[0].strip().lower()
+    return mime_type.startswith("text/") or mime_type in COMPRESSIBLE_TYPES
+
+
+async def put_brotli_variant(s3, key, content_type):
+    """
+    Store a Brotli-compressed copy of an object next to it and return its
+    key, or None if compression doesn't make it smaller.
+    """
+    resp = await s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    async with resp["Body"]:
+        content = await resp["Body"].read()
+
+    compressed = await anyio.to_thread.run_sync(
+        lambda: brotli.compress(content, quality=11)
+    )
+    if len(compressed) >= len(content):
+        return None
+
+    br_key = f"{key}.br"
+    await s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=br_key,
+        Body=compressed,
+        ContentType=content_type,
+        ContentEncoding="br",
+    )
+    return br_key
+
+
+async def iter_upload(file, first_chunk, chunk_size=PART_SIZE):
+    # Yield an UploadFile in fixed-size chunks, starting with one already read
+    chunk = first_chunk
+    while chunk:
+        yield chunk
+        chunk = await file.read(chunk_size)
+
+
+async def upload_stream(s3, file, key, content_type):
+    """
+    Upload an UploadFile to S3 and return (etag, size_bytes).
+
+    Files smaller than one part go up with a single PUT; anything larger
+    is streamed as a multipart upload.
+    """
+    first_chunk = await file.read(PART_SIZE)
+    if len(first_chunk) < PART_SIZE:
+        return await _put_small(s3, first_chunk, key, content_type)
+    return await _put_multipart(s3, file, first_chunk, key, content_type)
+
+
+async def _put_small(s3, content, key, content_type):
+    # hashlib releases the GIL, so hashing on a worker thread keeps the
+    # event loop free
+    digest = await anyio.to_thread.run_sync(hashlib.sha256, content)
+
+    await s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=content,
+        ContentType=content_type,
+    )
+
+    return digest.hexdigest(), len(content)
+
+
+async def _put_multipart(s3, file, first_chunk, key, content_type):
+    """
+    Stream an UploadFile to S3 as a multipart upload.
+
+    Parts are uploaded while the next ones are still being read, with at
+    most MAX_INFLIGHT_PARTS in flight. The SHA256 is updated per chunk in
+    the same pass, off the event loop.
+    """
+    upload = await s3.create_multipart_upload(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        ContentType=content_type,
+    )
+    upload_id = upload["UploadId"]
+
+    inflight = asyncio.Semaphore(MAX_INFLIGHT_PARTS)
+    tasks = []
+    failure = None
+    digest = hashlib.sha256()
+    size = 0
+
+    def record_failure(task):
+        nonlocal failure
+        if failure is None and not task.cancelled() and task.exception():
+            failure = task.exception()
+
+    async def put_part(part_number, chunk):
+        try:
+            resp = await s3.upload_part(
+                Bucket=BUCKET_NAME,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=chunk,
+            )
+        finally:
+            inflight.release()
+        return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+    try:
+        part_number = 1
+        async for chunk in iter_upload(file, first_chunk, PART_SIZE):
+            await inflight.acquire()
+            # Stop reading as soon as any part has failed
+            if failure is not None:
+                inflight.release()
+                raise failure
+
+            task = asyncio.create_task(put_part(part_number, chunk))
+            task.add_done_callback(record_failure)
+            tasks.append(task)
+            part_number += 1
+
+            # Hash while the part is uploading
+            await anyio.to_thread.run_sync(digest.update, chunk)
+            size += len(chunk)
+
+        parts = await asyncio.gather(*tasks)
+
+        await s3.complete_multipart_upload(
+            Bucket=BUCKET_NAME,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": sorted(parts, key=lambda p: p["PartNumber"])
+            },
+        )
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await s3.abort_multipart_upload(
+                Bucket=BUCKET_NAME,
+                Key=key,
+                UploadId=upload_id,
+            )
+        except Exception:
+            # Re-raise the original error, not the failed cleanup
+            pass
+        raise
+
+    return digest.hexdigest(), size
@@ -1,8 +1,11 @@
 import uuid
-import hashlib
 import secrets
-from datetime import datetime, timedelta
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 
+import anyio.to_thread
 from fastapi import (
     FastAPI,
     UploadFile,
@@ -12,26 +15,121 @@ from fastapi import (
     Request,
     Response,
 )
-from sqlalchemy.orm import Session
+from fastapi.responses import (
+    ORJSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import engine, SessionLocal
-from app.models import Base, Asset, AssetVersion, AccessToken
-from app.storage import s3, BUCKET_NAME
+from app.models import Base, Asset, AssetVersion, AccessToken, http_date
+from app.cache import get_asset, get_version, get_version_url
+from app.storage import (
+    create_s3_client,
+    iter_object,
+    upload_stream,
+    put_brotli_variant,
+    is_compressible,
+    BROTLI_MAX_BYTES,
+    warm_up,
+    BUCKET_NAME,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Upload reads and hashing run on the shared worker threads; raise
+    # anyio's default of 40 so concurrent uploads don't queue behind it
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 100
 
-app = FastAPI()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
-Base.metadata.create_all(bind=engine)
+    # One shared async S3 client for the whole process
+    async with create_s3_client() as s3:
+        await warm_up(s3)
+        app.state.s3 = s3
+        yield
+
+    await engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 # ---------------------------------------
 # Database Dependency
 # ---------------------------------------
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+# ---------------------------------------
+# S3 Client Dependency
+# ---------------------------------------
+def get_s3(request: Request):
+    return request.app.state.s3
+
+
+# ---------------------------------------
+# Conditional GET
+# ---------------------------------------
+def _strip_etag(tag):
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    return tag.strip('"')
+
+
+def check_conditional(request, etag, last_modified, headers):
+    """
+    Return a 304 response if the client's cached copy is still fresh,
+    otherwise None. If-None-Match takes precedence over If-Modified-Since.
+
+    headers are the caching headers (ETag, Cache-Control, Last-Modified,
+    Vary) the full response would carry; a 304 must repeat them.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {_strip_etag(tag) for tag in if_none_match.split(",")}
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+        return None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have second precision
+        if last_modified.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers)
+
+    return None
+
+
+# ---------------------------------------
+# Content Negotiation
+# ---------------------------------------
+def accepts_brotli(accept_encoding):
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() != "br":
+            continue
+        params = params.strip()
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
 
 
 # ---------------------------------------
@@ -46,37 +144,39 @@ def read_root():
 # Upload Asset
 # ---------------------------------------
 @app.post("/assets/upload")
-async def upload_asset(file: UploadFile = File(...), db: Session = Depends(get_db)):
-
-    content = await file.read()
-    etag = hashlib.sha256(content).hexdigest()
+async def upload_asset(
+    file: UploadFile = File(...),
+    s3=Depends(get_s3),
+):
 
     asset_id = uuid.uuid4()
     object_key = f"{asset_id}_{file.filename}"
 
-    s3.put_object(
-        Bucket=BUCKET_NAME,
-        Key=object_key,
-        Body=content,
-        ContentType=file.content_type,
+    etag, size_bytes = await upload_stream(
+        s3, file, object_key, file.content_type
     )
 
+    created_at = datetime.now(timezone.utc)
+
     new_asset = Asset(
         id=asset_id,
         object_storage_key=object_key,
         filename=file.filename,
         mime_type=file.content_type,
-        size_bytes=len(content),
+        size_bytes=size_bytes,
         etag=etag,
         is_private=False,
+        created_at=created_at,
+        last_modified_http=http_date(created_at),
     )
 
-    db.add(new_asset)
-    db.commit()
-    db.refresh(new_asset)
+    # Only open a session once the S3 upload is done
+    async with SessionLocal() as db:
+        db.add(new_asset)
+        await db.commit()
 
     return {
-        "id": str(new_asset.id),
+        "id": new_asset.id,
         "filename": new_asset.filename,
         "etag": new_asset.etag,
         "size": new_asset.size_bytes,
@@ -87,29 +187,40 @@ async def upload_asset(file: UploadFile = File(...), db: Session = Depends(get_d
 # GET Download (Mutable)
 # ---------------------------------------
 @app.get("/assets/{asset_id}/download")
-def download_asset(asset_id: str, request: Request, db: Session = Depends(get_db)):
-
-    asset = db.query(Asset).filter(Asset.id == asset_id).first()
+async def download_asset(
+    asset_id: uuid.UUID,
+    request: Request,
+    s3=Depends(get_s3),
+):
+
+    # The session is released before the S3 round trip so its connection
+    # goes back to the pool instead of idling
+    async with SessionLocal() as db:
+        asset = await get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
-    # Conditional GET support
-    if_none_match = request.headers.get("if-none-match")
-    if if_none_match == asset.etag:
-        return Response(status_code=304)
-
-    file_obj = s3.get_object(Bucket=BUCKET_NAME, Key=asset.object_storage_key)
-    file_content = file_obj["Body"].read()
-
     headers = {
         "ETag": asset.etag,
         "Cache-Control": "public, s-maxage=3600, max-age=60",
-        "Last-Modified": asset.created_at.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-        "Content-Disposition": f'inline; filename="{asset.filename}"',
+        "Last-Modified": asset.last_modified_http,
     }
 
-    return Response(
-        content=file_content,
+    not_modified = check_conditional(
+        request, asset.etag, asset.created_at, headers
+    )
+    if not_modified:
+        return not_modified
+
+    file_obj = await s3.get_object(
+        Bucket=BUCKET_NAME, Key=asset.object_storage_key
+    )
+
+    headers["Content-Disposition"] = f'inline; filename="{asset.filename}"'
+    headers["Content-Length"] = str(file_obj["ContentLength"])
+
+    return StreamingResponse(
+        iter_object(file_obj["Body"]),
         media_type=asset.mime_type,
         headers=headers,
     )
@@ -119,16 +230,19 @@ def download_asset(asset_id: str, request: Request, db: Session = Depends(get_db
 # HEAD Download (Mutable)
 # ---------------------------------------
 @app.head("/assets/{asset_id}/download")
-def head_asset(asset_id: str, db: Session = Depends(get_db)):
+async def head_asset(
+    asset_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+):
 
-    asset = db.query(Asset).filter(Asset.id == asset_id).first()
+    asset = await get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
     headers = {
         "ETag": asset.etag,
         "Cache-Control": "public, s-maxage=3600, max-age=60",
-        "Last-Modified": asset.created_at.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Last-Modified": asset.last_modified_http,
         "Content-Length": str(asset.size_bytes),
         "Content-Type": asset.mime_type,
     }
@@ -140,105 +254,111 @@ def head_asset(asset_id: str, db: Session = Depends(get_db)):
 # Publish Immutable Version
 # ---------------------------------------
 @app.post("/assets/{asset_id}/publish")
-def publish_asset(asset_id: str, db: Session = Depends(get_db)):
+async def publish_asset(
+    asset_id: uuid.UUID,
+    s3=Depends(get_s3),
+):
 
-    asset = db.query(Asset).filter(Asset.id == asset_id).first()
+    async with SessionLocal() as db:
+        asset = await get_asset(db, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
+    # Compress once here; every later download of the version benefits
+    br_key = None
+    if (
+        is_compressible(asset.mime_type)
+        and 0 < asset.size_bytes <= BROTLI_MAX_BYTES
+    ):
+        br_key = await put_brotli_variant(
+            s3, asset.object_storage_key, asset.mime_type
+        )
+
+    created_at = datetime.now(timezone.utc)
+
     version = AssetVersion(
         asset_id=asset.id,
         object_storage_key=asset.object_storage_key,
         etag=asset.etag,
+        br_object_storage_key=br_key,
+        created_at=created_at,
+        last_modified_http=http_date(created_at),
     )
 
-    db.add(version)
-    db.commit()
-    db.refresh(version)
+    async with SessionLocal() as db:
+        db.add(version)
+        await db.commit()
 
     return {
-        "version_id": str(version.id),
-        "asset_id": str(asset.id),
+        "version_id": version.id,
+        "asset_id": asset.id,
         "etag": version.etag,
     }
 
 
 # ---------------------------------------
-# GET Immutable Public Endpoint
+# GET/HEAD Immutable Public Endpoint
 # ---------------------------------------
-@app.get("/assets/public/{version_id}")
-def get_public_version(version_id: str, db: Session = Depends(get_db)):
-
-    version = db.query(AssetVersion).filter(
-        AssetVersion.id == version_id
-    ).first()
-
+# HEAD shares the handler so it returns exactly the headers GET would,
+# including the redirect's Location and lifetime
+@app.api_route("/assets/public/{version_id}", methods=["GET", "HEAD"])
+async def get_public_version(
+    version_id: uuid.UUID,
+    request: Request,
+    s3=Depends(get_s3),
+):
+
+    async with SessionLocal() as db:
+        version = await get_version(db, version_id)
     if not version:
         raise HTTPException(status_code=404, detail="Version not found")
 
-    file_obj = s3.get_object(Bucket=BUCKET_NAME, Key=version.object_storage_key)
-    file_content = file_obj["Body"].read()
-
+    # No conditional handling here: a 304 would refresh a cached redirect
+    # while keeping its old Location, so revalidation could keep a client
+    # on a presigned URL past its expiry. Always hand out a fresh 307.
     headers = {
         "ETag": version.etag,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Last-Modified": version.created_at.strftime(
-            "%a, %d %b %Y %H:%M:%S GMT"
-        ),
+        "Cache-Control": "public, max-age=86400",
+        "Last-Modified": version.last_modified_http,
+        "Vary": "Accept-Encoding",
     }
 
-    return Response(
-        content=file_content,
-        media_type="application/octet-stream",
-        headers=headers,
+    use_brotli = version.br_object_storage_key is not None and accepts_brotli(
+        request.headers.get("accept-encoding")
     )
 
+    # Let the client fetch the bytes straight from object storage.
+    # The redirect is cached for less than the presigned URL lifetime.
+    url = await get_version_url(s3, version, brotli=use_brotli)
 
-# ---------------------------------------
-# HEAD Immutable Public Endpoint (IMPORTANT FIX)
-# ---------------------------------------
-@app.head("/assets/public/{version_id}")
-def head_public_version(version_id: str, db: Session = Depends(get_db)):
-
-    version = db.query(AssetVersion).filter(
-        AssetVersion.id == version_id
-    ).first()
-
-    if not version:
-        raise HTTPException(status_code=404, detail="Version not found")
-
-    headers = {
-        "ETag": version.etag,
-        "Cache-Control": "public, max-age=31536000, immutable",
-        "Last-Modified": version.created_at.strftime(
-            "%a, %d %b %Y %H:%M:%S GMT"
-        ),
-    }
-
-    return Response(status_code=200, headers=headers)
+    return RedirectResponse(url, status_code=307, headers=headers)
 
 
 # ---------------------------------------
 # Generate Access Token
 # ---------------------------------------
 @app.post("/assets/{asset_id}/generate-token")
-def generate_access_token(asset_id: str, db: Session = Depends(get_db)):
+async def generate_access_token(
+    asset_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+):
 
-    asset = db.query(Asset).filter(Asset.id == asset_id).first()
+    asset = await db.get(Asset, asset_id)
     if not asset:
         raise HTTPException(status_code=404, detail="Asset not found")
 
     token_value = secrets.token_urlsafe(32)
-    expiration_time = datetime.utcnow() + timedelta(minutes=5)
+    expiration_time = datetime.now(timezone.utc) + timedelta(minutes=5)
 
     token = AccessToken(
         token=token_value,
         asset_id=asset.id,
         expires_at=expiration_time,
+        expires_at_epoch=int(expiration_time.timestamp()),
     )
 
     db.add(token)
-    db.commit()
+    await db.commit()
 
     return {
         "token": token_value,
@@ -250,35 +370,65 @@ def generate_access_token(asset_id: str, db: Session = Depends(get_db)):
 # Private Asset Endpoint
 # ---------------------------------------
 @app.get("/assets/private/{token}")
-def get_private_asset(token: str, db: Session = Depends(get_db)):
+async def get_private_asset(
+    token: str,
+    request: Request,
+    s3=Depends(get_s3),
+):
+
+    # One joined lookup for the token and the few Asset columns the
+    # response needs
+    async with SessionLocal() as db:
+        asset = (
+            await db.execute(
+                select(
+                    AccessToken.expires_at_epoch,
+                    AccessToken.expires_at,
+                    Asset.object_storage_key,
+                    Asset.etag,
+                    Asset.mime_type,
+                    Asset.created_at,
+                    Asset.last_modified_http,
+                )
+                .join(Asset, Asset.id == AccessToken.asset_id)
+                .where(AccessToken.token == token)
+            )
+        ).first()
 
-    token_record = db.query(AccessToken).filter(
-        AccessToken.token == token
-    ).first()
-
-    if not token_record:
+    if not asset:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    if token_record.expires_at < datetime.utcnow():
-        raise HTTPException(status_code=403, detail="Token expired")
-
-    asset = db.query(Asset).filter(
-        Asset.id == token_record.asset_id
-    ).first()
+    # Integer compare against the stored epoch; tokens issued before the
+    # column existed fall back to expires_at
+    expires_at_epoch = asset.expires_at_epoch
+    if expires_at_epoch is None:
+        expires_at_epoch = int(asset.expires_at.timestamp())
 
-    file_obj = s3.get_object(Bucket=BUCKET_NAME, Key=asset.object_storage_key)
-    file_content = file_obj["Body"].read()
+    if expires_at_epoch <= int(time.time()):
+        raise HTTPException(status_code=403, detail="Token expired")
 
     headers = {
         "Cache-Control": "private, no-store, no-cache, must-revalidate",
         "ETag": asset.etag,
-        "Last-Modified": asset.created_at.strftime(
-            "%a, %d %b %Y %H:%M:%S GMT"
+        "Last-Modified": (
+            asset.last_modified_http or http_date(asset.created_at)
         ),
     }
 
-    return Response(
-        content=file_content,
+    not_modified = check_conditional(
+        request, asset.etag, asset.created_at, headers
+    )
+    if not_modified:
+        return not_modified
+
+    file_obj = await s3.get_object(
+        Bucket=BUCKET_NAME, Key=asset.object_storage_key
+    )
+
+    headers["Content-Length"] = str(file_obj["ContentLength"])
+
+    return StreamingResponse(
+        iter_object(file_obj["Body"]),
         media_type=asset.mime_type,
         headers=headers,
     )
@@ -1,30 +1,100 @@
-import requests
+import argparse
+import asyncio
+import math
 import time
 
+import httpx
+
 BASE_URL = "http://127.0.0.1:8000"
 VERSION_ID = "55ccdbe8-8d24-4dec-bcd2-6164703a3180"
 
-URL = f"{BASE_URL}/assets/public/{VERSION_ID}"
+TOTAL_REQUESTS = 1000
+CONCURRENCY = 4
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HEAD benchmark")
+    parser.add_argument(
+        "-n", "--requests", type=positive_int, default=TOTAL_REQUESTS
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=positive_int, default=CONCURRENCY
+    )
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--version-id", default=VERSION_ID)
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="multiplex over HTTP/2 (needs a TLS origin that speaks h2)",
+    )
+    return parser.parse_args()
+
+
+async def run(url, total, concurrency, http2):
+    # Caps in-flight requests at the requested concurrency
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    success = 0
+    errors = 0
+
+    async def one(client):
+        nonlocal success, errors
+        async with slots:
+            t0 = time.perf_counter()
+            try:
+                response = await client.head(url)
+            except httpx.HTTPError:
+                # Count connection failures instead of aborting the whole run
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - t0)
+            # The public endpoint answers HEAD with the same 307 as GET
+            if response.status_code == 307:
+                success += 1
+
+    # 🔥 Persistent, pooled connections (important!)
+    limits = httpx.Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    async with httpx.AsyncClient(http2=http2, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client) for _ in range(total)))
+        total_time = time.perf_counter() - start
+
+    return success, errors, total_time, sorted(latencies)
+
 
-TOTAL_REQUESTS = 50
+def main():
+    args = parse_args()
+    url = f"{args.base_url}/assets/public/{args.version_id}"
 
-success = 0
-start = time.time()
+    success, errors, total_time, latencies = asyncio.run(
+        run(url, args.requests, args.concurrency, args.http2)
+    )
 
-# 🔥 Use persistent session (important!)
-with requests.Session() as session:
-    for i in range(TOTAL_REQUESTS):
-        response = session.head(URL)
-        if response.status_code == 200:
-            success += 1
+    print("------ Benchmark Results ------")
+    print("Total Requests:", args.requests)
+    print("Concurrency:", args.concurrency)
+    print("Successful:", success)
+    print("Errors:", errors)
+    print("Total Time:", round(total_time, 2), "seconds")
+    print("Throughput:", round(args.requests / total_time, 1), "req/s")
 
-end = time.time()
+    if latencies:
+        avg_latency = sum(latencies) / len(latencies)
+        # Nearest-rank percentile
+        p99_latency = latencies[math.ceil(0.99 * len(latencies)) - 1]
+        print("Average Latency:", round(avg_latency, 4), "seconds")
+        print("p99 Latency:", round(p99_latency, 4), "seconds")
 
-total_time = end - start
-avg_latency = total_time / TOTAL_REQUESTS
 
-print("------ Benchmark Results ------")
-print("Total Requests:", TOTAL_REQUESTS)
-print("Successful:", success)
-print("Total Time:", round(total_time, 2), "seconds")
-print("Average Latency:", round(avg_latency, 4), "seconds")
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,39 @@
+import asyncio
+import hashlib
+import io
+import secrets
+
+import psycopg2
 import pytest
 from fastapi.testclient import TestClient
+from app import storage
+from app.database import DATABASE_URL
 from main import app
 
-client = TestClient(app)
 
+def execute_sql(sql, params=()):
+    # Direct sync connection for setting up rows the API can't create
+    conn = psycopg2.connect(DATABASE_URL.replace("+asyncpg", ""))
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Entering the client runs the lifespan, which opens the S3 client
+    with TestClient(app) as c:
+        yield c
 
-def test_health():
+
+def test_health(client):
     response = client.get("/")
     assert response.status_code == 200
 
 
-def test_upload_and_download():
+def test_upload_and_download(client):
     files = {"file": ("test.txt", b"hello world", "text/plain")}
     upload = client.post("/assets/upload", files=files)
     assert upload.status_code == 200
@@ -22,7 +45,7 @@ def test_upload_and_download():
     assert download.headers["etag"]
 
 
-def test_conditional_304():
+def test_conditional_304(client):
     files = {"file": ("test2.txt", b"cache test", "text/plain")}
     upload = client.post("/assets/upload", files=files)
     asset_id = upload.json()["id"]
@@ -33,3 +56,216 @@ def test_conditional_304():
         headers={"If-None-Match": etag}
     )
     assert response.status_code == 304
+
+
+def test_public_version_redirects(client):
+    files = {"file": ("test3.txt", b"immutable", "text/plain")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+
+    publish = client.post(f"/assets/{asset_id}/publish")
+    assert publish.status_code == 200
+    version_id = publish.json()["version_id"]
+
+    response = client.get(
+        f"/assets/public/{version_id}", follow_redirects=False
+    )
+    assert response.status_code == 307
+    assert response.headers["location"]
+    assert response.headers["etag"] == upload.json()["etag"]
+
+    head = client.head(
+        f"/assets/public/{version_id}", follow_redirects=False
+    )
+    assert head.status_code == 307
+    assert head.headers["location"] == response.headers["location"]
+    assert head.headers["cache-control"] == response.headers["cache-control"]
+
+
+def test_public_version_revalidation_gets_fresh_redirect(client):
+    files = {"file": ("test4.txt", b"immutable cache", "text/plain")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+    version_id = client.post(f"/assets/{asset_id}/publish").json()["version_id"]
+
+    # A 304 would keep a cached redirect alive with a stale presigned URL
+    response = client.get(
+        f"/assets/public/{version_id}",
+        headers={"If-None-Match": f'"{upload.json()["etag"]}"'},
+        follow_redirects=False,
+    )
+    assert response.status_code == 307
+    assert response.headers["location"]
+    assert response.headers["cache-control"] == "public, max-age=86400"
+
+
+def test_private_asset_with_token(client):
+    files = {"file": ("secret.txt", b"top secret", "text/plain")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+
+    token = client.post(f"/assets/{asset_id}/generate-token").json()["token"]
+
+    response = client.get(f"/assets/private/{token}")
+    assert response.status_code == 200
+    assert response.content == b"top secret"
+    assert "no-store" in response.headers["cache-control"]
+
+    invalid = client.get("/assets/private/not-a-real-token")
+    assert invalid.status_code == 401
+
+
+def test_public_version_serves_brotli_variant(client):
+    body = b"compress me " * 500
+    files = {"file": ("page.html", body, "text/html")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+    version_id = client.post(f"/assets/{asset_id}/publish").json()["version_id"]
+
+    plain = client.get(
+        f"/assets/public/{version_id}",
+        headers={"Accept-Encoding": "identity"},
+        follow_redirects=False,
+    )
+    assert ".br" not in plain.headers["location"]
+
+    encoded = client.get(
+        f"/assets/public/{version_id}",
+        headers={"Accept-Encoding": "gzip, br"},
+        follow_redirects=False,
+    )
+    assert encoded.status_code == 307
+    assert ".br" in encoded.headers["location"]
+    assert encoded.headers["vary"] == "Accept-Encoding"
+
+    revalidated = client.get(
+        f"/assets/public/{version_id}",
+        headers={"If-None-Match": upload.json()["etag"], "Accept-Encoding": "br"},
+        follow_redirects=False,
+    )
+    assert revalidated.status_code == 307
+    assert ".br" in revalidated.headers["location"]
+    assert revalidated.headers["vary"] == "Accept-Encoding"
+
+
+def test_download_without_stored_last_modified(client):
+    files = {"file": ("legacy.txt", b"legacy row", "text/plain")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+
+    # Rows from before the column existed hold NULL
+    execute_sql(
+        "UPDATE assets SET last_modified_http = NULL WHERE id = %s",
+        (asset_id,),
+    )
+
+    download = client.get(f"/assets/{asset_id}/download")
+    assert download.status_code == 200
+    assert download.headers["last-modified"].endswith(" GMT")
+
+
+def test_private_asset_expired_token(client):
+    files = {"file": ("expiring.txt", b"short lived", "text/plain")}
+    upload = client.post("/assets/upload", files=files)
+    asset_id = upload.json()["id"]
+    expired_token = secrets.token_urlsafe(16)
+    legacy_token = secrets.token_urlsafe(16)
+
+    execute_sql(
+        "INSERT INTO access_tokens (token, asset_id, expires_at,"
+        " expires_at_epoch) VALUES (%s, %s, now() - interval '1 minute',"
+        " extract(epoch from now())::bigint - 60)",
+        (expired_token, asset_id),
+    )
+    # Tokens issued before expires_at_epoch existed hold NULL there
+    execute_sql(
+        "INSERT INTO access_tokens (token, asset_id, expires_at)"
+        " VALUES (%s, %s, now() + interval '5 minutes')",
+        (legacy_token, asset_id),
+    )
+
+    expired = client.get(f"/assets/private/{expired_token}")
+    assert expired.status_code == 403
+
+    legacy = client.get(f"/assets/private/{legacy_token}")
+    assert legacy.status_code == 200
+
+
+def test_multipart_upload_round_trip(client, monkeypatch):
+    # 5 MiB is the smallest part S3 accepts for all but the last part
+    monkeypatch.setattr(storage, "PART_SIZE", 5 * 1024 * 1024)
+    monkeypatch.setattr(storage, "MAX_INFLIGHT_PARTS", 2)
+    calls = []
+    put_multipart = storage._put_multipart
+
+    async def spy(*args, **kwargs):
+        calls.append(args)
+        return await put_multipart(*args, **kwargs)
+
+    monkeypatch.setattr(storage, "_put_multipart", spy)
+
+    content = secrets.token_bytes(11 * 1024 * 1024)
+    files = {"file": ("large.bin", content, "application/octet-stream")}
+    upload = client.post("/assets/upload", files=files)
+    assert upload.status_code == 200
+    assert calls
+
+    body = upload.json()
+    assert body["etag"] == hashlib.sha256(content).hexdigest()
+    assert body["size"] == len(content)
+
+    download = client.get(f"/assets/{body['id']}/download")
+    assert download.status_code == 200
+    assert download.content == content
+
+
+class FailingS3:
+    # Fails the second part and the abort that follows it
+    def __init__(self):
+        self.parts = []
+        self.aborted = False
+
+    async def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "upload"}
+
+    async def upload_part(self, PartNumber, **kwargs):
+        self.parts.append(PartNumber)
+        if PartNumber == 2:
+            raise RuntimeError("part failed")
+        return {"ETag": f"etag-{PartNumber}"}
+
+    async def complete_multipart_upload(self, **kwargs):
+        raise AssertionError("completed a failed upload")
+
+    async def abort_multipart_upload(self, **kwargs):
+        self.aborted = True
+        raise RuntimeError("abort failed")
+
+
+class CountingFile:
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+        self.reads = 0
+
+    async def read(self, size):
+        self.reads += 1
+        # Give in-flight parts a chance to finish between reads
+        await asyncio.sleep(0)
+        return self.stream.read(size)
+
+
+def test_multipart_upload_failure_aborts(monkeypatch):
+    monkeypatch.setattr(storage, "PART_SIZE", 4)
+    monkeypatch.setattr(storage, "MAX_INFLIGHT_PARTS", 1)
+    s3 = FailingS3()
+    file = CountingFile(b"x" * 4 * 100)
+
+    with pytest.raises(RuntimeError, match="part failed"):
+        asyncio.run(
+            storage.upload_stream(s3, file, "key", "application/octet-stream")
+        )
+
+    assert s3.aborted
+    assert 2 in s3.parts
+    # Reading stopped shortly after the failure, not at the end of the file
+    assert file.reads < 10